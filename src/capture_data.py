@@ -21,7 +21,12 @@ import os
 import time
 import datetime
 import logging
-import csv
+import logging.handlers
+import collections
+import queue
+import signal
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
 # Sensor-specific imports
 import board
@@ -29,7 +34,8 @@ import adafruit_sht31d  # For SHT30
 import adafruit_sht4x   # For SHT45
 import busio            
 import gpsd             # For GPS
-import RPi.GPIO as GPIO # For I/O ~ LEDs
+import gpiod            # For I/O ~ LEDs
+from gpiod.line import Direction, Value
 
 # --- Configuration ---
 # IMPORTANT: Adjust this path if your project is not in /home/user/heat_project
@@ -40,15 +46,40 @@ OPERATIONAL_LOGS_DIR = os.path.join(BASE_PROJECT_DIR, "logs")
 CSV_DATA_DIR = os.path.join(BASE_PROJECT_DIR, "data")
 
 LOG_INTERVAL_SECONDS = 5  # How often to log data (in seconds)
+# Per-tick INFO messages only go to the console; the log file keeps warnings and errors so it
+# doesn't compete with the CSV writes for the SD card. Set to logging.INFO to log everything to file.
+OPERATIONAL_LOG_FILE_LEVEL = logging.WARNING
+LOG_BUFFER_RECORDS = 100  # Log file records kept in memory before being written out together
+BATCH_SIZE = 60           # Most rows the writer thread collects before writing them to the CSV file
+CSV_WRITE_MAX_DELAY_SECONDS = 1.0 # Longest a row waits in the writer thread before it's handed to the OS
+SYNC_EVERY_N_ROWS = 60    # How many rows to buffer before forcing them to disk (60 rows = 5 min at 5 s)
+# CSV file space reserved at a time; 0 (the default) disables preallocation. Only enable it where the logger
+# is always stopped cleanly: after a power cut the file keeps a zero-filled tail that breaks CSV readers.
+CSV_PREALLOCATE_BYTES = 0
+GPS_READ_TIMEOUT_SECONDS = 1.0 # How long a tick waits for gpsd before reusing the last fix
+GPS_MAX_PACKET_AGE_SECONDS = 3 * LOG_INTERVAL_SECONDS # Older reused fixes mean gpsd is hung; log them as "No Fix"
+
+# --- CSV Row Format ---
+# None of the fields contain commas or quotes, so rows (and the header) are written directly without csv.writer.
+# Lines end in '\r\n', the terminator csv.writer used, so new files match older ones.
+CSV_LINE_TERMINATOR = "\r\n"
+CSV_ROW_FORMAT = "{},{:.2f},{:.2f},{},{:.6f},{:.6f},{:.2f},{:.2f},{:.2f},{:.2f},{},{},{:.1f},{},{},{}" + CSV_LINE_TERMINATOR
 
 # --- LED Configuration ---
+GPIO_CHIP = "/dev/gpiochip0" # GPIO character device the LED pins (BCM numbers) belong to
 LED_SHT_STATUS_PIN = 16
 LED_GPS_STATUS_PIN = 20
 LED_LOGGING_STATUS_PIN = 21
+LED_FLASH_SECONDS = 1     # How long the logging LED stays on after each data write
 
 # --- Global Sensor Objects (initialized in main) ---
 sht_sensor = None
 i2c = None
+led_lines = None # gpiod line request holding the LED pins
+
+# --- System Timestamp Cache (see utc_timestamp) ---
+last_timestamp_sec = None
+last_timestamp_str = "" # Date and time up to the second, without the fraction
 
 # --- Setup Logging (for operational messages) ---
 # Ensure the log directories exist before setting up logging or writing data
@@ -59,8 +90,20 @@ os.makedirs(CSV_DATA_DIR, exist_ok=True)
 current_datetime_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 OPERATIONAL_LOG_FILE = os.path.join(OPERATIONAL_LOGS_DIR, f"datalogger_operational_{current_datetime_str}.log")
 
+formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+file_handler = logging.FileHandler(OPERATIONAL_LOG_FILE) # This log is for script operations/errors, NOT data
+file_handler.setFormatter(formatter)
+
+# Buffer file records in memory and write them out together, either when the buffer is full
+# or straight away for ERROR and above. The buffer is flushed at exit by logging.shutdown().
+memory_handler = logging.handlers.MemoryHandler(
+    capacity=LOG_BUFFER_RECORDS, flushLevel=logging.ERROR, target=file_handler
+)
+memory_handler.setLevel(OPERATIONAL_LOG_FILE_LEVEL)
+
 logging.basicConfig(
-    filename=OPERATIONAL_LOG_FILE, # This log is for script operations/errors, NOT data
+    handlers=[memory_handler],
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
@@ -68,7 +111,6 @@ logging.basicConfig(
 # Also set up a console handler so you see logs in the terminal when running manually
 console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO) # Adjust as needed for console verbosity
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 console_handler.setFormatter(formatter)
 logging.getLogger().addHandler(console_handler) # Add the console handler to the root logger
 
@@ -77,28 +119,38 @@ logging.info(f"Data will be logged to CSV in: {CSV_DATA_DIR}")
 logging.info(f"Logging interval: {LOG_INTERVAL_SECONDS} seconds.")
 logging.info("Press Ctrl+C to stop.")
 
-# --- GPIO Setup Function ---
+# --- GPIO Setup Functions ---
 def setup_gpio():
-    """Initializes GPIO pins for LEDs."""
+    """Requests the LED GPIO lines as outputs, with all LEDs initially off."""
+    global led_lines # Declare that we're modifying the global led_lines object
     try:
-        GPIO.setmode(GPIO.BCM) # Use Broadcom SOC channel numbering (GPIO numbers)
-
-        # Setup LED pins as outputs
-        GPIO.setup(LED_SHT_STATUS_PIN, GPIO.OUT)
-        GPIO.setup(LED_GPS_STATUS_PIN, GPIO.OUT)
-        GPIO.setup(LED_LOGGING_STATUS_PIN, GPIO.OUT)
+        # Offsets on the GPIO chip are the Broadcom SOC channel numbers (GPIO numbers)
+        led_lines = gpiod.request_lines(
+            GPIO_CHIP,
+            consumer="heat_project",
+            config={
+                (LED_SHT_STATUS_PIN, LED_GPS_STATUS_PIN, LED_LOGGING_STATUS_PIN): gpiod.LineSettings(
+                    direction=Direction.OUTPUT, output_value=Value.INACTIVE # Turn off all LEDs initially
+                )
+            },
+        )
         logging.info("LED GPIO pins set up.")
-        
-        # Turn off all LEDs initially
-        GPIO.output(LED_SHT_STATUS_PIN, GPIO.LOW)
-        GPIO.output(LED_GPS_STATUS_PIN, GPIO.LOW)
-        GPIO.output(LED_LOGGING_STATUS_PIN, GPIO.LOW)
 
     except Exception as e:
         logging.critical(f"Error setting up GPIO: {e}")
-        GPIO.cleanup() # Clean up in case of error during setup
         raise # Re-raise to stop execution
 
+
+def cleanup_gpio():
+    """Turns all LEDs off and releases the GPIO lines."""
+    if led_lines:
+        led_lines.set_values({
+            LED_SHT_STATUS_PIN: Value.INACTIVE,
+            LED_GPS_STATUS_PIN: Value.INACTIVE,
+            LED_LOGGING_STATUS_PIN: Value.INACTIVE,
+        })
+        led_lines.release()
+
 # --- Sensor Setup Functions ---
 
 def setup_sht():
@@ -109,16 +161,18 @@ def setup_sht():
         i2c = busio.I2C(board.SCL, board.SDA)
         logging.info("I2C bus initialized successfully for SHT sensors.")
     except Exception as e:
-        logging.error(f"Error initializing I2C bus: {e}")
-        logging.error("Please ensure I2C is enabled and wired correctly.")
-        GPIO.output(LED_SHT_STATUS_PIN, GPIO.LOW) # Turn off SHT LED on error
+        logging.error(
+            f"Error initializing I2C bus: {e}\n"
+            "Please ensure I2C is enabled and wired correctly."
+        )
+        led_lines.set_value(LED_SHT_STATUS_PIN, Value.INACTIVE) # Turn off SHT LED on error
         raise # Re-raise the exception to stop execution if I2C fails
 
     try:
         # Attempt to create SHT4x sensor
         sht_sensor = adafruit_sht4x.SHT4x(i2c)
         logging.info("SHT4x sensor (e.g. SHT45) object created")
-        GPIO.output(LED_SHT_STATUS_PIN, GPIO.HIGH) # Turn on SHT LED
+        led_lines.set_value(LED_SHT_STATUS_PIN, Value.ACTIVE) # Turn on SHT LED
     except ValueError:
         logging.warning("SHT4x not found at default address 0x44. Attempting to initialize SHT3x.")
         try:
@@ -126,19 +180,21 @@ def setup_sht():
             # Create the SHT31D sensor object
             sht_sensor = adafruit_sht31d.SHT31D(i2c)
             logging.info("SHT31D sensor object created.")
-            GPIO.output(LED_SHT_STATUS_PIN, GPIO.HIGH) # Turn on SHT LED
+            led_lines.set_value(LED_SHT_STATUS_PIN, Value.ACTIVE) # Turn on SHT LED
         except ValueError:
-            logging.error("SHT31D not found at default address 0x44.")
-            logging.error("Check wiring and run 'sudo i2cdetect -y 1'.")
-            GPIO.output(LED_SHT_STATUS_PIN, GPIO.LOW) # Turn off SHT LED on error
+            logging.error(
+                "SHT31D not found at default address 0x44.\n"
+                "Check wiring and run 'sudo i2cdetect -y 1'."
+            )
+            led_lines.set_value(LED_SHT_STATUS_PIN, Value.INACTIVE) # Turn off SHT LED on error
             raise # Re-raise
         except Exception as e:
             logging.error(f"An unexpected error occurred while creating SHT31D sensor object: {e}")
-            GPIO.output(LED_SHT_STATUS_PIN, GPIO.LOW) # Turn off SHT LED on error
+            led_lines.set_value(LED_SHT_STATUS_PIN, Value.INACTIVE) # Turn off SHT LED on error
             raise # Re-raise
     except Exception as e:
         logging.error(f"An unexpected error occurred while creating SHT4x sensor object: {e}")
-        GPIO.output(LED_SHT_STATUS_PIN, GPIO.LOW)
+        led_lines.set_value(LED_SHT_STATUS_PIN, Value.INACTIVE)
         raise # Re-raise
     logging.info("-" * 30)
 
@@ -148,18 +204,199 @@ def setup_gps():
     try:
         gpsd.connect()
         logging.info("Connected to gpsd.")
-        GPIO.output(LED_GPS_STATUS_PIN, GPIO.HIGH) # Turn on GPS LED (initially connected)
+        led_lines.set_value(LED_GPS_STATUS_PIN, Value.ACTIVE) # Turn on GPS LED (initially connected)
     except ConnectionRefusedError:
-        logging.error("Error: Could not connect to gpsd. Make sure gpsd is running.")
-        logging.error("Try: sudo systemctl enable gpsd && sudo systemctl start gpsd")
-        logging.error("Also check if a GPS device is connected and streaming data to gpsd.")
-        GPIO.output(LED_GPS_STATUS_PIN, GPIO.LOW) # Turn off GPS LED on error
+        logging.error(
+            "Error: Could not connect to gpsd. Make sure gpsd is running.\n"
+            "Try: sudo systemctl enable gpsd && sudo systemctl start gpsd\n"
+            "Also check if a GPS device is connected and streaming data to gpsd."
+        )
+        led_lines.set_value(LED_GPS_STATUS_PIN, Value.INACTIVE) # Turn off GPS LED on error
         raise # Re-raise
     except Exception as e:
         logging.error(f"An unexpected error occurred while connecting to gpsd: {e}")
-        GPIO.output(LED_GPS_STATUS_PIN, GPIO.LOW) # Turn off GPS LED on error
+        led_lines.set_value(LED_GPS_STATUS_PIN, Value.INACTIVE) # Turn off GPS LED on error
         raise # Re-raise
 
+# --- Timestamp Helpers ---
+
+def utc_timestamp(time_ns):
+    """Formats a time.time_ns() value as 'YYYY-MM-DD HH:MM:SS.nnnnnnnnn UTC'.
+
+    The date and time part is only re-formatted when the second changes; the nanoseconds are appended every call.
+    """
+    global last_timestamp_sec, last_timestamp_str
+    sec, frac_ns = divmod(time_ns, 1_000_000_000)
+    if sec != last_timestamp_sec:
+        last_timestamp_str = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(sec))
+        last_timestamp_sec = sec
+    return f"{last_timestamp_str}.{frac_ns:09d} UTC"
+
+
+def format_gps_timestamp(gps_time):
+    """Reformats gpsd's 'YYYY-MM-DDTHH:MM:SS.sssZ' time as 'YYYY-MM-DD HH:MM:SS UTC' by slicing the fixed layout."""
+    if len(gps_time) >= 20 and gps_time[10] == 'T' and gps_time.endswith('Z'):
+        return gps_time[:10] + ' ' + gps_time[11:19] + ' UTC'
+    return gps_time # Fallback if the layout is unexpected
+
+# --- Sensor Read Functions ---
+
+def read_sht():
+    """Reads temperature and humidity from the SHT sensor.
+
+    Returns (temperature, humidity, read_us), with "N/A" or "READ_ERROR" markers on failure.
+    """
+    if not sht_sensor: # Check if sensor was initialized successfully
+        logging.warning("SHT31D sensor not initialized. Skipping temperature/humidity data.")
+        return "N/A", "N/A", "N/A"
+    start_ns = time.monotonic_ns()
+    try:
+        # Reading .temperature and then .relative_humidity would trigger two separate measurements
+        if isinstance(sht_sensor, adafruit_sht4x.SHT4x):
+            temperature, humidity = sht_sensor.measurements
+        else:
+            # SHT31D has no public property for both; in its default single-shot mode _read() returns
+            # temperature and humidity from one measurement
+            temperature, humidity = sht_sensor._read()
+    except Exception as e:
+        logging.error("Error reading SHT31D sensor: %s", e)
+        temperature = humidity = "READ_ERROR"
+    return temperature, humidity, (time.monotonic_ns() - start_ns) // 1000
+
+
+def read_gps():
+    """Gets the current GPS position packet from gpsd.
+
+    Returns (packet, read_us), with packet set to None on failure.
+    """
+    start_ns = time.monotonic_ns()
+    try:
+        # This call can sometimes block if no data is coming
+        packet = gpsd.get_current()
+    except Exception as e: # Must not raise: start_gps_read() completes its Future only via set_result()
+        logging.error("Error getting GPS packet from gpsd: %s", e)
+        packet = None
+    return packet, (time.monotonic_ns() - start_ns) // 1000
+
+
+def start_gps_read():
+    """Runs read_gps() on a new daemon thread and returns a Future for its (packet, read_us) result.
+
+    gpsd-py3's socket read has no timeout, and the interpreter waits for executor workers at exit,
+    so a poll stuck on a hung gpsd must not run on the ThreadPoolExecutor or the process could never stop.
+    """
+    gps_future = Future()
+    threading.Thread(target=lambda: gps_future.set_result(read_gps()), name="gps_read", daemon=True).start()
+    return gps_future
+
+# --- CSV Write Helpers ---
+
+def format_or_na(value, spec):
+    """Formats value with the given format spec, or returns "N/A" if the value is missing."""
+    return format(value, spec) if value is not None else "N/A"
+
+
+def format_row_with_markers(system_timestamp_utc, temperature, humidity, gps_timestamp_utc, packet, gps_fix_type,
+                            gps_fix_age, sht_read_us, gps_read_us, tick_latency_us):
+    """Builds a CSV line field by field, for rows where some values are "N/A" or "READ_ERROR" markers."""
+    latitude = longitude = altitude = speed = climb = track = satellites = fix_age = "N/A"
+    if packet: # Only passed in when there is a GPS fix
+        latitude = f'{packet.lat:.6f}'
+        longitude = f'{packet.lon:.6f}'
+        altitude = format_or_na(getattr(packet, 'alt', None), '.2f')
+        speed = format_or_na(getattr(packet, 'hspeed', None), '.2f')
+        climb = format_or_na(getattr(packet, 'climb', None), '.2f')
+        track = format_or_na(getattr(packet, 'track', None), '.2f')
+        satellites = format_or_na(getattr(packet, 'sats', None), '')
+        fix_age = f'{gps_fix_age:.1f}'
+
+    data_row = [
+        system_timestamp_utc, # Primary timestamp from Pi's system clock (UTC)
+        f"{temperature:.2f}" if isinstance(temperature, float) else temperature,
+        f"{humidity:.2f}" if isinstance(humidity, float) else humidity,
+        gps_timestamp_utc,
+        latitude, longitude, altitude, speed,
+        climb, track, satellites, gps_fix_type, fix_age,
+        sht_read_us, gps_read_us, tick_latency_us
+    ]
+    return ",".join(str(field) for field in data_row) + CSV_LINE_TERMINATOR
+
+
+def write_row_batch(csv_fd, offset, allocated_end, row_buffer):
+    """Writes all buffered CSV lines at offset with os.pwrite() and empties the buffer.
+
+    Reserves another CSV_PREALLOCATE_BYTES first if the rows would run past allocated_end.
+    Returns the new (offset, allocated_end).
+    """
+    payload = "".join(row_buffer).encode("utf-8")
+    while CSV_PREALLOCATE_BYTES and offset + len(payload) > allocated_end:
+        os.posix_fallocate(csv_fd, allocated_end, CSV_PREALLOCATE_BYTES)
+        allocated_end += CSV_PREALLOCATE_BYTES
+    while payload: # pwrite may write less than asked for
+        written = os.pwrite(csv_fd, payload, offset)
+        offset += written
+        payload = payload[written:]
+    row_buffer.clear()
+    return offset, allocated_end
+
+
+def csv_writer_loop(csv_fd, offset, row_queue):
+    """Runs on the CSV writer thread: writes queued lines in batches from offset on and syncs them, until it receives None.
+
+    A batch is written once it holds BATCH_SIZE lines or its oldest line has waited CSV_WRITE_MAX_DELAY_SECONDS,
+    so a power cut only loses what the OS hasn't written back yet; fsync still runs every SYNC_EVERY_N_ROWS lines.
+
+    If CSV_PREALLOCATE_BYTES is set, file space is reserved that much at a time and the unused space is cut off on exit.
+    """
+    row_buffer = collections.deque(maxlen=BATCH_SIZE * 2) # Bounded, so a failing disk can't eat all memory
+    rows_since_sync = 0
+    dropped_rows = 0 # Rows pushed out of the full buffer while writes were failing
+    allocated_end = offset # End of the space reserved so far
+    write_deadline = None # time.monotonic() by which the oldest buffered line has to be written
+    try:
+        while True:
+            timeout = None if write_deadline is None else max(0.0, write_deadline - time.monotonic())
+            try:
+                csv_line = row_queue.get(timeout=timeout)
+            except queue.Empty:
+                csv_line = "" # Nothing new in time: write what is buffered
+            if csv_line is None: # Sentinel from log_data: logging has stopped
+                break
+            if csv_line:
+                if len(row_buffer) == row_buffer.maxlen:
+                    dropped_rows += 1
+                    logging.warning("CSV writes keep failing, dropped the oldest buffered row (%d rows lost so far).", dropped_rows)
+                row_buffer.append(csv_line)
+                if write_deadline is None:
+                    write_deadline = time.monotonic() + CSV_WRITE_MAX_DELAY_SECONDS
+                if len(row_buffer) < BATCH_SIZE and time.monotonic() < write_deadline:
+                    continue
+            try:
+                batch_rows = len(row_buffer)
+                offset, allocated_end = write_row_batch(csv_fd, offset, allocated_end, row_buffer)
+                write_deadline = None
+                rows_since_sync += batch_rows
+                if rows_since_sync >= SYNC_EVERY_N_ROWS:
+                    os.fsync(csv_fd) # Commit the written rows to disk in one go
+                    rows_since_sync = 0
+            except Exception as e:
+                logging.error("Error writing data rows to CSV file: %s", e)
+                write_deadline = time.monotonic() + CSV_WRITE_MAX_DELAY_SECONDS # Retry later instead of spinning
+    finally:
+        # Write whatever is still buffered, drop any unused preallocated space and commit it all before the file is closed
+        try:
+            offset, allocated_end = write_row_batch(csv_fd, offset, allocated_end, row_buffer)
+        finally:
+            # Runs even if the final write fails, so a clean exit never leaves a zero-filled tail
+            os.ftruncate(csv_fd, offset)
+            os.fsync(csv_fd)
+
+
+def handle_sigterm(signum, frame):
+    """Turns SIGTERM (e.g. 'systemctl stop') into a normal exit so the final CSV sync still runs."""
+    logging.info("SIGTERM received, stopping datalogger.")
+    raise SystemExit(0)
+
 # --- Main Data Logging Function ---
 
 def log_data():
@@ -173,115 +410,158 @@ def log_data():
     csv_header = [
         "System_Timestamp_UTC", "Temperature_C", "Humidity_RH",
         "GPS_Timestamp_UTC", "Latitude", "Longitude", "Altitude_m", "Speed_mps",
-        "Climb_mps", "Track_deg", "Satellites", "GPS_Fix_Type"
+        "Climb_mps", "Track_deg", "Satellites", "GPS_Fix_Type", "GPS_Fix_Age_s",
+        "Sensor_Read_us", "GPS_Read_us", "Tick_Latency_us" # For checking sampling jitter afterwards
     ]
 
     # Open CSV file and write header (only if file is new)
-    # Using 'with' statement ensures the file is properly closed even if errors occur
+    # Using 'with' statement ensures the file is properly closed even if errors occur.
+    # Rows are written with os.pwrite() at a tracked offset, so the file is opened unbuffered and without O_APPEND.
     try:
-        with open(CSV_DATA_FILE, 'a', newline='') as csvfile:
-            csv_writer = csv.writer(csvfile)
+        with open(os.open(CSV_DATA_FILE, os.O_WRONLY | os.O_CREAT, 0o644), 'wb', buffering=0) as csvfile:
+            csv_fd = csvfile.fileno()
+            csv_offset = os.fstat(csv_fd).st_size # New rows go after anything already in the file
             # Write header only if the file is empty or newly created
-            if os.stat(CSV_DATA_FILE).st_size == 0: 
-                csv_writer.writerow(csv_header)
-                logging.info(f"CSV header written to {CSV_DATA_FILE}")
-
-            while True: # Loop indefinitely until interrupted (e.g., by Ctrl+C)
-                # --- Get System UTC Timestamp ---
-                # This is the timestamp of when the data was collected by the Pi
-                system_timestamp_utc = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-
-                # --- Read SHT31D Data ---
-                temperature = "N/A"
-                humidity = "N/A"
-                try:
-                    if sht_sensor: # Check if sensor was initialized successfully
-                        temperature = sht_sensor.temperature
-                        humidity = sht_sensor.relative_humidity
-                    else:
-                        logging.warning("SHT31D sensor not initialized. Skipping temperature/humidity data.")
-                except Exception as e:
-                    logging.error(f"Error reading SHT31D sensor: {e}")
-                    temperature = "READ_ERROR"
-                    humidity = "READ_ERROR"
-
-                # --- Read GPS Data ---
-                packet = None
-                try:
-                    # Get the current GPS position packet
-                    # This call can sometimes block if no data is coming, consider a timeout if needed
-                    packet = gpsd.get_current()
-                except Exception as e:
-                    logging.error(f"Error getting GPS packet from gpsd: {e}")
-
-                gps_timestamp_utc = "N/A"
-                latitude = "N/A"
-                longitude = "N/A"
-                altitude = "N/A"
-                speed = "N/A"
-                climb = "N/A"
-                track = "N/A"
-                satellites = "N/A"
-                gps_fix_type = "No Fix"
-
-                # Update GPS data and status LED based on fix
-                if packet and packet.mode >= 2: # 2D fix (mode 2) or 3D fix (mode 3)
-                    GPIO.output(LED_GPS_STATUS_PIN, GPIO.HIGH) # Keep GPS LED on if fix
-                    if packet.time:
+            if csv_offset == 0:
+                csv_offset = os.pwrite(csv_fd, (",".join(csv_header) + CSV_LINE_TERMINATOR).encode("utf-8"), 0)
+                logging.info("CSV header written to %s", CSV_DATA_FILE)
+
+            # Rows are handed to a separate writer thread so a slow SD card never delays a sensor read
+            row_queue = queue.SimpleQueue()
+            writer_thread = threading.Thread(target=csv_writer_loop, args=(csv_fd, csv_offset, row_queue), name="csv_writer")
+            writer_thread.start()
+
+            led_off_timer = None
+            next_tick = time.monotonic() # Deadline of the current logging interval
+            sensor_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sensor_read") # SHT reads; gpsd polls use start_gps_read()
+            gps_future = None          # gpsd poll that is still running, carried over between ticks
+            last_packet = None         # Last packet received from gpsd
+            last_packet_received = 0.0 # time.monotonic() when last_packet arrived
+
+            # Bind functions and constants used on every tick to locals, saving the global/attribute lookups
+            set_led = led_lines.set_value
+            led_on = Value.ACTIVE
+            led_off = Value.INACTIVE
+            submit_read = sensor_pool.submit
+            queue_row = row_queue.put
+            format_row = CSV_ROW_FORMAT.format
+            monotonic = time.monotonic
+            time_ns = time.time_ns
+            sleep = time.sleep
+            try:
+                while True: # Loop indefinitely until interrupted (e.g., by Ctrl+C)
+                    # --- Get System UTC Timestamp ---
+                    # This is the timestamp of when the data was collected by the Pi
+                    tick_ns = time_ns() # Read the system clock once per tick
+                    system_timestamp_utc = utc_timestamp(tick_ns)
+
+                    # One try block covers the whole tick; the sensor reads handle their own errors on the worker threads
+                    row_queued = False
+                    try:
+                        # --- Read SHT and GPS Data ---
+                        # The I2C and gpsd reads run on separate threads so they overlap instead of adding up
+                        sht_future = submit_read(read_sht)
+                        if gps_future is None: # Don't start a second poll while one is still waiting on gpsd
+                            gps_future = start_gps_read()
+                        temperature, humidity, sht_read_us = sht_future.result()
+
+                        # A slow gpsd must not hold up the tick: reuse the last packet and record how old it is
                         try:
-                            # Attempt to format the GPS timestamp
-                            gps_timestamp_obj = datetime.datetime.strptime(packet.time, '%Y-%m-%dT%H:%M:%S.%fZ')
-                            gps_timestamp_utc = gps_timestamp_obj.strftime('%Y-%m-%d %H:%M:%S UTC')
-                        except ValueError:
-                            gps_timestamp_utc = packet.time # Fallback if parsing fails
-
-                    latitude = f'{packet.lat:.6f}'
-                    longitude = f'{packet.lon:.6f}'
-                    altitude = f'{packet.alt:.2f}' if hasattr(packet, 'alt') else "N/A"
-                    speed = f'{packet.hspeed:.2f}' if hasattr(packet, 'hspeed') else "N/A"
-                    climb = f'{packet.climb:.2f}' if hasattr(packet, 'climb') else "N/A"
-                    track = f'{packet.track:.2f}' if hasattr(packet, 'track') else "N/A"
-                    satellites = packet.sats if hasattr(packet, 'sats') else "N/A"
-                    gps_fix_type = '3D' if packet.mode == 3 else '2D'
-                    logging.info(f"GPS Fix: {gps_fix_type}, Lat: {latitude}, Lon: {longitude}")
-                else:
-                    GPIO.output(LED_GPS_STATUS_PIN, GPIO.LOW) # Turn off GPS LED if no fix
-                    logging.warning("Waiting for GPS fix or no GPS data available from gpsd...")
-
-                # --- Prepare Data Row for CSV ---
-                data_row = [
-                    system_timestamp_utc, # Primary timestamp from Pi's system clock (UTC)
-                    f"{temperature:.2f}" if isinstance(temperature, float) else temperature,
-                    f"{humidity:.2f}" if isinstance(humidity, float) else humidity,
-                    gps_timestamp_utc,
-                    latitude, longitude, altitude, speed,
-                    climb, track, satellites, gps_fix_type
-                ]
-
-                # --- Write to CSV & Flash Logging LED ---
-                try:
-                    csv_writer.writerow(data_row)
-                    csvfile.flush() # Ensure data is written to disk immediately
-                    os.fsync(csvfile.fileno()) # Force OS to write to physical disk
-                    logging.info(f"Data logged to CSV: T={temperature:.2f}C, H={humidity:.2f}%, GPS_TS={gps_timestamp_utc}")
-
-                    # --- Logging LED Flash ---
-                    GPIO.output(LED_LOGGING_STATUS_PIN, GPIO.HIGH) # Turn on logging LED
-                    time.sleep(1) # Keep it on for 1 second
-                    GPIO.output(LED_LOGGING_STATUS_PIN, GPIO.LOW) # Turn off logging LED
-
-                except Exception as e:
-                    logging.error(f"Error writing data row to CSV file: {e}")
-
-                # Wait for the next logging interval, adjusting for the LED flash duration
-                remaining_sleep_time = max(0, LOG_INTERVAL_SECONDS - 1) # Subtract 1 second for the LED flash
-                time.sleep(remaining_sleep_time) 
+                            packet, gps_read_us = gps_future.result(timeout=GPS_READ_TIMEOUT_SECONDS)
+                            gps_future = None
+                            if packet:
+                                last_packet = packet
+                                last_packet_received = monotonic()
+                            gps_fix_age = 0.0
+                        except FutureTimeoutError:
+                            logging.warning("gpsd did not answer within %s s, reusing last GPS packet.", GPS_READ_TIMEOUT_SECONDS)
+                            packet = last_packet
+                            gps_fix_age = monotonic() - last_packet_received
+                            gps_read_us = "N/A" # Still running
+                            if packet and gps_fix_age > GPS_MAX_PACKET_AGE_SECONDS:
+                                # gpsd-py3's read has no timeout, so a hung gpsd would otherwise repeat this fix forever
+                                logging.warning("Last GPS packet is %.0f s old; gpsd may be hung. Logging as No Fix.", gps_fix_age)
+                                packet = None
+
+                        gps_timestamp_utc = "N/A"
+                        gps_fix_type = "No Fix"
+
+                        # Update GPS data and status LED based on fix
+                        has_fix = bool(packet and packet.mode >= 2) # 2D fix (mode 2) or 3D fix (mode 3)
+                        if has_fix:
+                            set_led(LED_GPS_STATUS_PIN, led_on) # Keep GPS LED on if fix
+                            if packet.time:
+                                gps_timestamp_utc = format_gps_timestamp(packet.time)
+
+                            gps_fix_type = '3D' if packet.mode == 3 else '2D'
+                            logging.info("GPS Fix: %s, Lat: %.6f, Lon: %.6f", gps_fix_type, packet.lat, packet.lon)
+                        else:
+                            set_led(LED_GPS_STATUS_PIN, led_off) # Turn off GPS LED if no fix
+                            logging.warning("Waiting for GPS fix or no GPS data available from gpsd...")
+
+                        # --- Prepare Data Row for CSV ---
+                        tick_latency_us = int((monotonic() - next_tick) * 1_000_000) # Tick deadline to row queued
+                        if has_fix and isinstance(temperature, float) and isinstance(humidity, float):
+                            # Fast path: every field is a number, so the whole line is built with one format call
+                            csv_line = format_row(
+                                system_timestamp_utc, temperature, humidity, gps_timestamp_utc,
+                                packet.lat, packet.lon, packet.alt, packet.hspeed,
+                                packet.climb, packet.track, packet.sats, gps_fix_type, gps_fix_age,
+                                sht_read_us, gps_read_us, tick_latency_us
+                            )
+                        else:
+                            csv_line = format_row_with_markers(
+                                system_timestamp_utc, temperature, humidity, gps_timestamp_utc,
+                                packet if has_fix else None, gps_fix_type, gps_fix_age,
+                                sht_read_us, gps_read_us, tick_latency_us
+                            )
+
+                        # --- Queue Row for CSV & Flash Logging LED ---
+                        queue_row(csv_line)
+                        row_queued = True
+                        if isinstance(temperature, float):
+                            logging.info("Data logged to CSV: T=%.2fC, H=%.2f%%, GPS_TS=%s", temperature, humidity, gps_timestamp_utc)
+                        else: # "N/A" or "READ_ERROR" markers
+                            logging.info("Data logged to CSV: T=%sC, H=%s%%, GPS_TS=%s", temperature, humidity, gps_timestamp_utc)
+
+                        # --- Logging LED Flash ---
+                        # The LED is turned off by a timer thread so the loop is not blocked during the flash
+                        set_led(LED_LOGGING_STATUS_PIN, led_on) # Turn on logging LED
+                        led_off_timer = threading.Timer(LED_FLASH_SECONDS, set_led, args=(LED_LOGGING_STATUS_PIN, led_off))
+                        led_off_timer.daemon = True
+                        led_off_timer.start()
+
+                    except Exception as e:
+                        logging.error("Error logging data row: %s", e)
+                        if not row_queued: # Still record the tick, so the gap is visible in the CSV
+                            queue_row(format_row_with_markers(
+                                system_timestamp_utc, "READ_ERROR", "READ_ERROR", "N/A", None, "No Fix", None,
+                                "N/A", "N/A", "N/A"
+                            ))
+
+                    # Wait until the next deadline so time spent reading sensors does not add up as drift
+                    next_tick += LOG_INTERVAL_SECONDS
+                    now = monotonic()
+                    if now - next_tick > LOG_INTERVAL_SECONDS:
+                        # More than a whole interval behind (e.g. a stalled read): skip the missed ticks
+                        # instead of logging a burst of rows to catch up
+                        missed_ticks = int((now - next_tick) // LOG_INTERVAL_SECONDS)
+                        logging.warning("Logging loop fell %d interval(s) behind, skipping ahead.", missed_ticks)
+                        next_tick += missed_ticks * LOG_INTERVAL_SECONDS
+                    sleep(max(0, next_tick - now))
+            finally:
+                if led_off_timer:
+                    led_off_timer.cancel() # Don't toggle the LED after GPIO has been cleaned up
+                sensor_pool.shutdown(wait=False)
+                # Let the writer thread write and commit whatever is still queued before the file is closed
+                row_queue.put(None)
+                writer_thread.join()
 
     except ConnectionRefusedError:
         logging.critical("Could not connect to gpsd. Ensure gpsd is running and configured correctly.")
         raise # Re-raise to ensure the main error handler catches it and logs it as critical
     except Exception as e:
-        logging.critical(f"An unhandled error occurred in log_data loop: {e}", exc_info=True)
+        logging.critical("An unhandled error occurred in log_data loop: %s", e, exc_info=True)
         raise # Re-raise to ensure the main error handler catches it and logs it as critical
     finally:
         logging.info("Exiting log_data function.")
@@ -290,6 +570,9 @@ def log_data():
 # --- Main Execution Block ---
 
 if __name__ == "__main__":
+    # Make sure buffered CSV rows are written to disk when stopped as a service
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
     try:
         # Initialize GPIO for LEDs first
         setup_gpio()
@@ -308,5 +591,5 @@ if __name__ == "__main__":
         logging.critical(f"A critical error occurred, stopping the datalogger application: {e}", exc_info=True)
     finally:
         # Always ensure GPIO is cleaned up on exit
-        GPIO.cleanup() 
+        cleanup_gpio()
         logging.info("Datalogger application finished. GPIO cleaned up.")
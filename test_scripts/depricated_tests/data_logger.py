@@ -17,7 +17,10 @@ import os
 import time
 import datetime
 import logging
-import csv
+import logging.handlers
+import queue
+import signal
+import threading
 
 # Sensor-specific imports (uncomment these once hardware is connected and libraries installed)
 import board
@@ -35,36 +38,104 @@ OPERATIONAL_LOGS_DIR = os.path.join(BASE_PROJECT_DIR, "logs")
 CSV_DATA_DIR = os.path.join(BASE_PROJECT_DIR, "data")
 
 LOG_INTERVAL_SECONDS = 5  # How often to log data (in seconds)
+SYNC_EVERY_N_ROWS = 60    # How many written rows to fsync together (60 rows = 5 min at 5 s)
+LOG_FILE_BUFFER_BYTES = 64 * 1024  # Block buffer for the operational log file
+LOG_FLUSH_INTERVAL_SECONDS = 60    # How often buffered operational log lines are flushed (errors flush immediately)
+SHT_RETRY_DELAY_SECONDS = 0.01    # Back-off before the single retry of a failed SHT31D read
+GPS_POLL_INTERVAL_SECONDS = 1      # How often the background thread asks gpsd for the latest fix (receivers update at 1 Hz)
+GPS_MAX_PACKET_AGE_SECONDS = 5 * GPS_POLL_INTERVAL_SECONDS # Older packets mean gpsd is hung; log them as "No Fix"
+
+# --- CSV Field Formatting ---
+NA = "N/A"                       # Shared placeholder for missing values
+CSV_LINE_TERMINATOR = b"\r\n"    # Same line ending csv.writer used, so existing files stay consistent
+# Whole-row template for rows with a GPS fix and a good SHT reading; the format spec is parsed once, not per field
+CSV_ROW_FORMAT = "{},{:.2f},{:.2f},{},{:.6f},{:.6f},{:.2f},{:.2f},{:.2f},{:.2f},{},{}\r\n"
+FORMAT_2DP = "{:.2f}".format     # Bound once instead of parsing an f-string spec every row
+FORMAT_6DP = "{:.6f}".format
+# Optional gpsd packet attributes: (CSV column, attribute name, formatter); missing ones are written as N/A
+GPS_OPTIONAL_FIELDS = (
+    (6, "alt", FORMAT_2DP),
+    (7, "hspeed", FORMAT_2DP),
+    (8, "climb", FORMAT_2DP),
+    (9, "track", FORMAT_2DP),
+    (10, "sats", str),
+)
 
 # --- Global Sensor Objects (initialized in main) ---
 sht_sensor = None
+gps_packet = None              # Latest packet from the GPS reader thread (None until the first poll or after an error)
+gps_packet_received = 0.0      # time.monotonic() when gps_packet was stored
+gps_packet_lock = threading.Lock()
 
 # --- Setup Logging (for operational messages) ---
-# Ensure the log directories exist before setting up logging or writing data
-os.makedirs(OPERATIONAL_LOGS_DIR, exist_ok=True)
-os.makedirs(CSV_DATA_DIR, exist_ok=True)
-
-# Generate a timestamped filename for the *operational log file*
-current_datetime_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-OPERATIONAL_LOG_FILE = os.path.join(OPERATIONAL_LOGS_DIR, f"datalogger_operational_{current_datetime_str}.log")
-
-logging.basicConfig(
-    filename=OPERATIONAL_LOG_FILE, # This log is for script operations/errors, NOT data
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
-
-# Also set up a console handler so you see logs in the terminal when running manually
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO) # Adjust as needed for console verbosity
-formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(formatter)
-logging.getLogger().addHandler(console_handler) # Add the console handler to the root logger
-
-logging.info(f"Datalogger starting. Operational logs to: {OPERATIONAL_LOG_FILE}")
-logging.info(f"Data will be logged to CSV in: {CSV_DATA_DIR}")
-logging.info(f"Logging interval: {LOG_INTERVAL_SECONDS} seconds.")
-logging.info("Press Ctrl+C to stop.")
+# Module logger for the logging loop; its records propagate to the root handlers set up in _configure_logging().
+# Calls in the loop pass their arguments separately so messages are only formatted when emitted.
+logger = logging.getLogger(__name__)
+
+class BufferedFileHandler(logging.StreamHandler):
+    """Writes to a block-buffered file and flushes it at most once per LOG_FLUSH_INTERVAL_SECONDS."""
+
+    def __init__(self, filename):
+        # StreamHandler.emit() flushes after every record, which would undo the buffering,
+        # so flush() below only hits the disk when the interval has passed or on errors
+        super().__init__(open(filename, 'a', buffering=LOG_FILE_BUFFER_BYTES, encoding='utf-8'))
+        self.next_flush = time.monotonic() + LOG_FLUSH_INTERVAL_SECONDS
+        self.force_flush = False
+
+    def emit(self, record):
+        self.force_flush = record.levelno >= logging.ERROR # Don't sit on errors if the Pi loses power
+        super().emit(record)
+
+    def flush(self):
+        now = time.monotonic()
+        if self.force_flush or now >= self.next_flush:
+            super().flush()
+            self.next_flush = now + LOG_FLUSH_INTERVAL_SECONDS
+
+    def close(self):
+        # Called by logging.shutdown() at exit: write out whatever is still buffered
+        self.acquire()
+        try:
+            if not self.stream.closed:
+                self.stream.flush()
+                self.stream.close()
+        finally:
+            self.release()
+        super().close()
+
+def _configure_logging():
+    """Creates the log/data directories, sets up operational logging and returns the started QueueListener."""
+    # Ensure the log directories exist before setting up logging or writing data
+    os.makedirs(OPERATIONAL_LOGS_DIR, exist_ok=True)
+    os.makedirs(CSV_DATA_DIR, exist_ok=True)
+
+    # Generate a timestamped filename for the *operational log file*
+    current_datetime_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    operational_log_file = os.path.join(OPERATIONAL_LOGS_DIR, f"datalogger_operational_{current_datetime_str}.log")
+
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+
+    file_handler = BufferedFileHandler(operational_log_file) # This log is for script operations/errors, NOT data
+    file_handler.setFormatter(formatter)
+
+    # Also set up a console handler so you see logs in the terminal when running manually
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(logging.INFO) # Adjust as needed for console verbosity
+    console_handler.setFormatter(formatter)
+
+    # The root logger only puts records on a queue; the listener thread does the file/console writes,
+    # so SD card latency never stalls the sensor loop. Stopped in the main block to flush what's queued.
+    # SimpleQueue because its put() is reentrant: handle_sigterm logs from a signal handler that may interrupt a put()
+    log_queue = queue.SimpleQueue()
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.handlers.QueueHandler(log_queue)]) # Real format applied by the listener's handlers
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    log_listener.start()
+
+    logging.info(f"Datalogger starting. Operational logs to: {operational_log_file}")
+    logging.info(f"Data will be logged to CSV in: {CSV_DATA_DIR}")
+    logging.info(f"Logging interval: {LOG_INTERVAL_SECONDS} seconds.")
+    logging.info("Press Ctrl+C to stop.")
+    return log_listener
 
 # --- Sensor Setup Functions ---
 
@@ -76,8 +147,10 @@ def setup_sht():
         i2c = busio.I2C(board.SCL, board.SDA)
         logging.info("I2C bus initialized successfully for SHT31D.")
     except Exception as e:
-        logging.error(f"Error initializing I2C bus: {e}")
-        logging.error("Please ensure I2C is enabled and wired correctly.")
+        logging.error(
+            f"Error initializing I2C bus: {e}\n"
+            "Please ensure I2C is enabled and wired correctly."
+        )
         raise # Re-raise the exception to stop execution if I2C fails
 
     try:
@@ -85,8 +158,10 @@ def setup_sht():
         sht_sensor = adafruit_sht31d.SHT31D(i2c)
         logging.info("SHT31D sensor object created.")
     except ValueError:
-        logging.error("SHT31D not found at default address 0x44.")
-        logging.error("Check wiring and run 'sudo i2cdetect -y 1'.")
+        logging.error(
+            "SHT31D not found at default address 0x44.\n"
+            "Check wiring and run 'sudo i2cdetect -y 1'."
+        )
         raise # Re-raise
     except Exception as e:
         logging.error(f"An unexpected error occurred while creating SHT31D sensor object: {e}")
@@ -95,18 +170,62 @@ def setup_sht():
 
 
 def setup_gps():
-    """Connects to the local gpsd server."""
+    """Connects to the local gpsd server and starts the background GPS reader thread."""
     try:
         gpsd.connect()
         logging.info("Connected to gpsd.")
     except ConnectionRefusedError:
-        logging.error("Error: Could not connect to gpsd. Make sure gpsd is running.")
-        logging.error("Try: sudo systemctl enable gpsd && sudo systemctl start gpsd")
-        logging.error("Also check if a GPS device is connected and streaming data to gpsd.")
+        logging.error(
+            "Error: Could not connect to gpsd. Make sure gpsd is running.\n"
+            "Try: sudo systemctl enable gpsd && sudo systemctl start gpsd\n"
+            "Also check if a GPS device is connected and streaming data to gpsd."
+        )
         raise # Re-raise
     except Exception as e:
         logging.error(f"An unexpected error occurred while connecting to gpsd: {e}")
         raise # Re-raise
+    threading.Thread(target=read_gps_forever, name="gps_reader", daemon=True).start()
+
+
+def read_gps_forever():
+    """Polls gpsd in the background so a slow or hung gpsd never stalls the logging loop."""
+    global gps_packet, gps_packet_received
+    while True:
+        try:
+            packet = gpsd.get_current()
+        except Exception as e:
+            logger.error("Error getting GPS packet from gpsd: %s", e)
+            packet = None # Log "No Fix" rather than repeating a stale position
+        with gps_packet_lock:
+            gps_packet = packet
+            gps_packet_received = time.monotonic()
+        time.sleep(GPS_POLL_INTERVAL_SECONDS)
+
+# --- Timestamp Helpers ---
+
+def format_gps_timestamp(gps_time):
+    """Reformats gpsd's 'YYYY-MM-DDTHH:MM:SS.sssZ' time as 'YYYY-MM-DD HH:MM:SS UTC' by slicing the fixed layout."""
+    if len(gps_time) >= 20 and gps_time[10] == 'T' and gps_time.endswith('Z'):
+        return gps_time[:10] + ' ' + gps_time[11:19] + ' UTC'
+    return gps_time # Fallback if the layout is unexpected
+
+# --- CSV Write Helpers ---
+
+def encode_row(fields):
+    """Joins already-formatted fields into one ASCII CSV line (no field contains commas or quotes)."""
+    return ",".join(fields).encode('ascii') + CSV_LINE_TERMINATOR
+
+
+def sync_csv_file(csvfile):
+    """Flushes Python's buffer and forces the OS to write the CSV file to the physical disk."""
+    csvfile.flush()
+    os.fsync(csvfile.fileno())
+
+
+def handle_sigterm(signum, frame):
+    """Turns SIGTERM into a normal exit so the final CSV sync still runs."""
+    logging.info("SIGTERM received, stopping datalogger.")
+    raise SystemExit(0)
 
 # --- Main Data Logging Function ---
 
@@ -125,93 +244,126 @@ def log_data():
     ]
 
     # Open CSV file and write header (only if file is new)
-    file_exists = os.path.exists(CSV_DATA_FILE)
     try:
-        with open(CSV_DATA_FILE, 'a', newline='') as csvfile:
-            csv_writer = csv.writer(csvfile)
-            if not file_exists or os.stat(CSV_DATA_FILE).st_size == 0: # Check if file is empty or new
-                csv_writer.writerow(csv_header)
+        try:
+            file_is_empty = os.stat(CSV_DATA_FILE).st_size == 0 # One stat call covers both "missing" and "empty"
+        except FileNotFoundError:
+            file_is_empty = True
+        # Binary mode: rows are pre-encoded, so the text encoding layer is skipped entirely
+        with open(CSV_DATA_FILE, 'ab') as csvfile:
+            if file_is_empty:
+                csvfile.write(encode_row(csv_header))
                 logging.info(f"CSV header written to {CSV_DATA_FILE}")
 
-            while True:
-                # --- Get System UTC Timestamp ---
-                # This is the timestamp of when the data was collected by the Pi
-                system_timestamp_utc = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S UTC")
-
-                # --- Read SHT31D Data ---
-                temperature = "N/A"
-                humidity = "N/A"
-                try:
-                    if sht_sensor: # Check if sensor was initialized successfully
-                        temperature = sht_sensor.temperature
-                        humidity = sht_sensor.relative_humidity
+            rows_since_sync = 0
+            data_row = [NA] * len(csv_header) # Reused for every row; encode_row() copies the values out
+            # Look these up once instead of on every iteration of the loop
+            gmtime = time.gmtime
+            sleep = time.sleep
+            monotonic = time.monotonic
+            format_row = CSV_ROW_FORMAT.format
+            read_sht = sht_sensor._read if sht_sensor else None
+            next_tick = monotonic() # Deadline of the current logging interval
+            try:
+                while True:
+                    # --- Get System UTC Timestamp ---
+                    # This is the timestamp of when the data was collected by the Pi
+                    t = gmtime() # Formatted by hand, much cheaper than datetime.utcnow().strftime()
+                    system_timestamp_utc = (
+                        f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d} UTC"
+                    )
+
+                    # --- Read SHT31D Data ---
+                    temperature = humidity = NA
+                    if read_sht: # Check if sensor was initialized successfully
+                        for attempt in range(2): # Retry once so a transient I2C glitch doesn't cost a READ_ERROR row
+                            try:
+                                # One measurement for both values; the .temperature/.relative_humidity properties
+                                # would each trigger their own (SHT31D has no public property returning both)
+                                temperature, humidity = read_sht()
+                                break
+                            except (OSError, RuntimeError) as e: # I2C errors / CRC mismatch
+                                if attempt == 0:
+                                    sleep(SHT_RETRY_DELAY_SECONDS)
+                                    continue
+                                logger.error("Error reading SHT31D sensor after retry: %s", e)
+                            except Exception as e:
+                                logger.error("Error reading SHT31D sensor: %s", e)
+                            temperature = "READ_ERROR"
+                            humidity = "READ_ERROR"
+                            break
+                    else:
+                        logger.warning("SHT31D sensor not initialized. Skipping temperature/humidity data.")
+
+                    # --- Read GPS Data ---
+                    # Take the latest packet from the reader thread; this never waits on gpsd
+                    with gps_packet_lock:
+                        packet = gps_packet
+                        packet_age = monotonic() - gps_packet_received
+                    if packet is not None and packet_age > GPS_MAX_PACKET_AGE_SECONDS:
+                        # get_current() has no timeout, so a hung gpsd leaves the last fix in place forever
+                        logger.warning("Last GPS packet is %.0f s old; gpsd may be hung. Logging as No Fix.", packet_age)
+                        packet = None
+
+                    gps_timestamp_utc = NA
+                    gps_fix_type = "No Fix"
+                    has_fix = packet is not None and packet.mode >= 2  # 2D fix (mode 2) or 3D fix (mode 3)
+
+                    if has_fix:
+                        if packet.time:
+                            gps_timestamp_utc = format_gps_timestamp(packet.time)
+                        gps_fix_type = '3D' if packet.mode == 3 else '2D'
+                        logger.info("GPS Fix: %s, Lat: %.6f, Lon: %.6f", gps_fix_type, packet.lat, packet.lon)
                     else:
-                        logging.warning("SHT31D sensor not initialized. Skipping temperature/humidity data.")
-                except Exception as e:
-                    logging.error(f"Error reading SHT31D sensor: {e}")
-                    temperature = "READ_ERROR"
-                    humidity = "READ_ERROR"
-
-                # --- Read GPS Data ---
-                packet = None
-                try:
-                    # Get the current GPS position packet
-                    # This call can sometimes block if no data is coming, consider a timeout if needed
-                    packet = gpsd.get_current()
-                except Exception as e:
-                    logging.error(f"Error getting GPS packet from gpsd: {e}")
-
-                gps_timestamp_utc = "N/A"
-                latitude = "N/A"
-                longitude = "N/A"
-                altitude = "N/A"
-                speed = "N/A"
-                climb = "N/A"
-                track = "N/A"
-                satellites = "N/A"
-                gps_fix_type = "No Fix"
-
-                if packet and packet.mode >= 2:  # 2D fix (mode 2) or 3D fix (mode 3)
-                    if packet.time:
-                        try:
-                            # Attempt to format the GPS timestamp
-                            gps_timestamp_obj = datetime.datetime.strptime(packet.time, '%Y-%m-%dT%H:%M:%S.%fZ')
-                            gps_timestamp_utc = gps_timestamp_obj.strftime('%Y-%m-%d %H:%M:%S UTC')
-                        except ValueError:
-                            gps_timestamp_utc = packet.time # Fallback if parsing fails
-
-                    latitude = f'{packet.lat:.6f}'
-                    longitude = f'{packet.lon:.6f}'
-                    altitude = f'{packet.alt:.2f}' if hasattr(packet, 'alt') else "N/A"
-                    speed = f'{packet.hspeed:.2f}' if hasattr(packet, 'hspeed') else "N/A"
-                    climb = f'{packet.climb:.2f}' if hasattr(packet, 'climb') else "N/A"
-                    track = f'{packet.track:.2f}' if hasattr(packet, 'track') else "N/A"
-                    satellites = packet.sats if hasattr(packet, 'sats') else "N/A"
-                    gps_fix_type = '3D' if packet.mode == 3 else '2D'
-                    logging.info(f"GPS Fix: {gps_fix_type}, Lat: {latitude}, Lon: {longitude}")
-                else:
-                    logging.warning("Waiting for GPS fix or no GPS data available from gpsd...")
-
-                # --- Prepare Data Row for CSV ---
-                data_row = [
-                    system_timestamp_utc, # Primary timestamp from Pi's system clock (UTC)
-                    f"{temperature:.2f}" if isinstance(temperature, float) else temperature,
-                    f"{humidity:.2f}" if isinstance(humidity, float) else humidity,
-                    gps_timestamp_utc,
-                    latitude, longitude, altitude, speed,
-                    climb, track, satellites, gps_fix_type
-                ]
-
-                # --- Write to CSV ---
-                try:
-                    csv_writer.writerow(data_row)
-                    csvfile.flush() # Ensure data is written to disk immediately
-                    os.fsync(csvfile.fileno()) # Force OS to write to physical disk
-                    logging.info(f"Data logged to CSV: T={temperature}C, H={humidity}%, GPS_TS={gps_timestamp_utc}")
-                except Exception as e:
-                    logging.error(f"Error writing data row to CSV file: {e}")
-
-                time.sleep(LOG_INTERVAL_SECONDS) # Wait for the next logging interval
+                        logger.warning("Waiting for GPS fix or no GPS data available from gpsd...")
+
+                    # --- Prepare Data Row for CSV ---
+                    if has_fix and isinstance(temperature, float) and isinstance(humidity, float):
+                        # Fast path: every field is a number, so the whole line is built with one format call
+                        csv_line = format_row(
+                            system_timestamp_utc, temperature, humidity, gps_timestamp_utc,
+                            packet.lat, packet.lon, packet.alt, packet.hspeed,
+                            packet.climb, packet.track, packet.sats, gps_fix_type
+                        ).encode('ascii')
+                    else:
+                        # Some fields are markers: fill the preallocated row in place and join it
+                        data_row[0] = system_timestamp_utc # Primary timestamp from Pi's system clock (UTC)
+                        data_row[1] = FORMAT_2DP(temperature) if isinstance(temperature, float) else temperature
+                        data_row[2] = FORMAT_2DP(humidity) if isinstance(humidity, float) else humidity
+                        data_row[3] = gps_timestamp_utc
+                        data_row[4] = FORMAT_6DP(packet.lat) if has_fix else NA
+                        data_row[5] = FORMAT_6DP(packet.lon) if has_fix else NA
+                        for slot, name, format_value in GPS_OPTIONAL_FIELDS:
+                            value = getattr(packet, name, None) if has_fix else None # One lookup instead of hasattr() plus the access
+                            data_row[slot] = NA if value is None else format_value(value)
+                        data_row[11] = gps_fix_type
+                        csv_line = encode_row(data_row)
+
+                    # --- Write to CSV ---
+                    try:
+                        csvfile.write(csv_line)
+                        csvfile.flush() # Hand each row to the OS right away so a power cut can't lose it from Python's buffer
+                        rows_since_sync += 1
+                        if rows_since_sync >= SYNC_EVERY_N_ROWS:
+                            sync_csv_file(csvfile) # Commit the written rows to disk in one go
+                            rows_since_sync = 0
+                        logger.info("Data logged to CSV: T=%sC, H=%s%%, GPS_TS=%s", temperature, humidity, gps_timestamp_utc)
+                    except Exception as e:
+                        logger.error("Error writing data row to CSV file: %s", e)
+
+                    # Wait until the next deadline so time spent reading sensors does not add up as drift
+                    next_tick += LOG_INTERVAL_SECONDS
+                    now = monotonic()
+                    if now - next_tick > LOG_INTERVAL_SECONDS:
+                        # More than a whole interval behind (e.g. a stalled read): skip the missed ticks
+                        # instead of logging a burst of rows to catch up
+                        missed_ticks = int((now - next_tick) // LOG_INTERVAL_SECONDS)
+                        logger.warning("Logging loop fell %d interval(s) behind, skipping ahead.", missed_ticks)
+                        next_tick += missed_ticks * LOG_INTERVAL_SECONDS
+                    sleep(max(0, next_tick - now))
+            finally:
+                # Commit the rows written since the last sync before the file is closed
+                sync_csv_file(csvfile)
 
     except ConnectionRefusedError:
         logging.critical("Could not connect to gpsd. Ensure gpsd is running and configured correctly.")
@@ -228,6 +380,10 @@ def log_data():
 # --- Main Execution Block ---
 
 if __name__ == "__main__":
+    # Make sure buffered CSV rows are written to disk when the process is terminated
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    log_listener = _configure_logging()
+
     try:
         # Initialize sensors and services
         setup_sht()
@@ -241,3 +397,4 @@ if __name__ == "__main__":
         logging.critical(f"A critical error occurred, stopping the datalogger application: {e}", exc_info=True)
     finally:
         logging.info("Datalogger application finished.")
+        log_listener.stop() # Drain queued records to the log file and console before exiting
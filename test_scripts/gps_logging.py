@@ -1,6 +1,5 @@
 import gpsd
 import time
-import datetime
 import logging
 
 # --- Configuration ---
@@ -14,6 +13,12 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+def format_gps_timestamp(gps_time):
+    """Reformats gpsd's 'YYYY-MM-DDTHH:MM:SS.sssZ' time as 'YYYY-MM-DD HH:MM:SS UTC' by slicing the fixed layout."""
+    if len(gps_time) >= 20 and gps_time[10] == 'T' and gps_time.endswith('Z'):
+        return gps_time[:10] + ' ' + gps_time[11:19] + ' UTC'
+    return gps_time # Fallback if the layout is unexpected
+
 def log_gps_data():
     try:
         # Connect to the local gpsd server
@@ -22,6 +27,7 @@ def log_gps_data():
 
         print(f"Logging GPS data to {LOG_FILE} every {LOG_INTERVAL_SECONDS} seconds. Press Ctrl+C to stop.")
 
+        next_tick = time.monotonic() # Deadline of the current logging interval
         while True:
             # Get the current GPS position packet
             packet = gpsd.get_current()
@@ -29,12 +35,7 @@ def log_gps_data():
             if packet.mode >= 2:  # 2D fix or 3D fix
                 timestamp_utc = ""
                 if packet.time:
-                    try:
-                        # Attempt to format the timestamp
-                        timestamp_obj = datetime.datetime.strptime(packet.time, '%Y-%m-%dT%H:%M:%S.%fZ')
-                        timestamp_utc = timestamp_obj.strftime('%Y-%m-%d %H:%M:%S UTC')
-                    except ValueError:
-                        timestamp_utc = packet.time # Fallback if parsing fails
+                    timestamp_utc = format_gps_timestamp(packet.time)
 
                 log_entry = (
                     f"Timestamp: {timestamp_utc}, "
@@ -56,7 +57,12 @@ def log_gps_data():
                 logging.warning("Waiting for GPS fix...")
                 print("Waiting for GPS fix...")
 
-            time.sleep(LOG_INTERVAL_SECONDS)
+            # Sleep until the next deadline instead of a fixed interval so the loop doesn't drift
+            next_tick += LOG_INTERVAL_SECONDS
+            now = time.monotonic()
+            if now > next_tick:
+                next_tick = now # Overran the interval (e.g. gpsd stalled): resync instead of catching up
+            time.sleep(next_tick - now)
 
     except ConnectionRefusedError:
         logging.error("Could not connect to gpsd. Make sure gpsd is running: sudo gpsd /dev/ttyS0 -F /var/run/gpsd.sock")
@@ -1,26 +1,32 @@
-import RPi.GPIO as GPIO
+import gpiod
+from gpiod.line import Direction, Value
 import time
 
+GPIO_CHIP = "/dev/gpiochip0"
 LED_SHT_PIN = 16
 LED_GPS_STATUS_PIN = 20
 LED_LOGGING_STATUS_PIN = 21
 
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(LED_SHT_PIN, GPIO.OUT)
-GPIO.setup(LED_GPS_STATUS_PIN, GPIO.OUT)
-GPIO.setup(LED_LOGGING_STATUS_PIN, GPIO.OUT)
+LED_PINS = (LED_SHT_PIN, LED_GPS_STATUS_PIN, LED_LOGGING_STATUS_PIN)
+# One set_values() call switches all three LEDs in a single request to the kernel
+ALL_LEDS_ON = {pin: Value.ACTIVE for pin in LED_PINS}
+ALL_LEDS_OFF = {pin: Value.INACTIVE for pin in LED_PINS}
+
+# Same line request as capture_data: offsets on the chip are the BCM GPIO numbers
+leds = gpiod.request_lines(
+    GPIO_CHIP,
+    consumer="led_test",
+    config={LED_PINS: gpiod.LineSettings(direction=Direction.OUTPUT, output_value=Value.INACTIVE)},
+)
 
 try:
     while True:
-        GPIO.output(LED_SHT_PIN, GPIO.HIGH)
-        GPIO.output(LED_GPS_STATUS_PIN  , GPIO.HIGH)
-        GPIO.output(LED_LOGGING_STATUS_PIN, GPIO.HIGH)
+        leds.set_values(ALL_LEDS_ON)
         time.sleep(1)
 
-        GPIO.output(LED_SHT_PIN, GPIO.LOW)
-        GPIO.output(LED_GPS_STATUS_PIN, GPIO.LOW)
-        GPIO.output(LED_LOGGING_STATUS_PIN, GPIO.LOW)
+        leds.set_values(ALL_LEDS_OFF)
         time.sleep(1)
 
 except KeyboardInterrupt:
-    GPIO.cleanup()
+    leds.set_values(ALL_LEDS_OFF)
+    leds.release()
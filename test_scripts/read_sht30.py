@@ -1,8 +1,17 @@
 import board
 import adafruit_sht31d
 import busio
+import gpiod
+from gpiod.line import Direction, Edge
 import time
 
+READ_INTERVAL_SECONDS = 5  # How often to print a reading when no ALERT event arrives
+GPIO_CHIP = "/dev/gpiochip0"
+# BCM GPIO wired to the SHT30 ALERT pin, or None if it isn't connected.
+# ALERT is a threshold alarm, not a data-ready signal: with the sensor's default limits it rises when
+# temperature/humidity leave roughly -10..60 C / 20..80 %RH, so those readings are printed right away.
+SHT_ALERT_PIN = None
+
 print("Adafruit SHT30 Test")
 
 # Create the I2C bus
@@ -29,13 +38,28 @@ except Exception as e:
     print(f"An unexpected error occurred while creating sensor object: {e}")
     exit()
 
+# Let the sensor measure on its own every 2 s, so a read is just a fetch of its latest result
+sensor.frequency = adafruit_sht31d.FREQUENCY_0_5
+sensor.mode = adafruit_sht31d.MODE_PERIODIC
+
+alert_request = None
+if SHT_ALERT_PIN is not None:
+    alert_request = gpiod.request_lines(
+        GPIO_CHIP,
+        consumer="read_sht30",
+        config={SHT_ALERT_PIN: gpiod.LineSettings(direction=Direction.INPUT, edge_detection=Edge.RISING)},
+    )
+    print(f"Waiting on SHT30 ALERT events on GPIO{SHT_ALERT_PIN}.")
+
 print("-" * 30)
 
 # Loop to read data
 while True:
     try:
-        temperature = sensor.temperature
-        humidity = sensor.relative_humidity
+        # One fetch returns both values; the library only returns lists if the fetch held several measurements
+        temperature, humidity = sensor._read()
+        if isinstance(temperature, list):
+            temperature, humidity = temperature[0], humidity[0]
 
         print(f"Temperature: {temperature:.2f} C / {temperature * 9/5 + 32:.2f} F")
         print(f"Humidity: {humidity:.2f} %")
@@ -43,6 +67,12 @@ while True:
 
     except Exception as e:
         print(f"Error reading sensor data: {e}")
-        print("Trying again in 5 seconds...")
+        print(f"Trying again in {READ_INTERVAL_SECONDS} seconds...")
 
-    time.sleep(5)
+    if alert_request:
+        # Block in the kernel until ALERT rises, or fall back to the normal interval
+        if alert_request.wait_edge_events(READ_INTERVAL_SECONDS):
+            alert_request.read_edge_events()
+            print("SHT30 ALERT: reading outside the alert limits.")
+    else:
+        time.sleep(READ_INTERVAL_SECONDS)